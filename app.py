@@ -4,14 +4,29 @@ Token-based authentication for cross-browser compatibility
 """
 
 import os
-from flask import Flask, render_template, request, jsonify
+import hashlib
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from openai import OpenAI
+from qdrant_client.models import QuantizationSearchParams, SearchParams
+from openai import DefaultHttpxClient, OpenAI
+import httpx
 import logging
 from datetime import datetime, timedelta
 import jwt
+import numpy as np
+import orjson
+import tiktoken
+import redis
 
 # Load environment variables (don't override existing ones from Render)
 load_dotenv(override=False)
@@ -23,8 +38,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify and request.get_json use it)"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-secret-key")
 
 # JWT Configuration
@@ -41,33 +69,279 @@ CORS(app,
 # Configuration
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# gRPC sends vectors as binary protobuf; set QDRANT_PREFER_GRPC=false where port 6334 is blocked
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "True").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
 COLLECTION_NAME = "bridgetext_scenarios"
+CONTEXT_PAYLOAD_FIELDS = ["text", "page_content", "content", "scenario", "description"]  # Only these are fetched, in priority order
+# Query-time HNSW beam width; top-3 retrieval over a small scenario collection needs little more than 64
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", 64))
+# Hits below this cosine score are off-topic and only add prompt tokens
+QDRANT_SCORE_THRESHOLD = float(os.getenv("QDRANT_SCORE_THRESHOLD", 0.3))
+# Searches the int8-quantized vectors (when the collection has them) then rescores the best candidates
+QDRANT_SEARCH_PARAMS = SearchParams(
+    hnsw_ef=QDRANT_HNSW_EF,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+# gRPC keepalive pings stop idle load balancers from dropping the channel between chats
+QDRANT_GRPC_OPTIONS = {
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+}
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Keep-alive pool shared by the OpenAI client and Qdrant's REST transport
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+REDIS_URL = os.getenv("REDIS_URL")  # Optional: keeps chat history server-side instead of inside the token
+HISTORY_KEY_PREFIX = "chat_history:"
+# Redis history writes may leave the request path only when a single worker process serves every turn:
+# with several workers (the Procfile defaults WEB_CONCURRENCY to 2) the next turn can land on another
+# process before a deferred write lands, so there the write stays synchronous
+HISTORY_WRITE_IN_BACKGROUND = int(os.getenv("WEB_CONCURRENCY", 2)) == 1
+FREE_MESSAGE_LIMIT = 10  # Messages per session (10 messages = 5 exchanges); also caps the stored Redis history
+
+# Embedding configuration
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 768  # Reduced from 1536 to match the Qdrant collection
+EMBEDDING_BATCH_MAX_SIZE = 64
+EMBEDDING_BATCH_MAX_WAIT_MS = 15  # How long the first request waits for others to join its batch
+EMBEDDING_TIMEOUT_SECONDS = 30
+# Embeddings only change with the model, so identical texts are cached far longer than context
+# (stored as float16 - half the memory - and upcast to float32 when read)
+EMBEDDING_CACHE_MAX_ENTRIES = 4096
+EMBEDDING_CACHE_TTL_SECONDS = 24 * 3600
+EMBEDDING_REQUEST_MAX_INPUTS = 2048  # OpenAI limit on inputs per embeddings call
+EMBEDDING_MAX_TOKENS = 8191  # OpenAI limit per input; one longer message would fail its whole batch
+
+# Chat completion configuration
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_TEMPERATURE = 0.7  # Higher for more natural/varied responses
+CHAT_MAX_TOKENS = 120  # Replies are 2-3 sentences (~60-90 tokens); the cap only bounds runaway generations
+# The prompt shows history as "User:/AI:" lines; stop if the model starts writing the next turn (also after an HTML break)
+CHAT_STOP_SEQUENCES = ["\nUser:", "\nAI:", "<br>User:", "<br>AI:"]
+# Per-process cap on in-flight chat completions so bursts queue here instead of hitting OpenAI rate limits
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", 16))
+
+# Prompt size caps (characters); context and history go into every GPT prompt
+HISTORY_PROMPT_EXCHANGES = 4  # Only the most recent exchanges are shown to GPT
+CONTEXT_ITEM_MAX_CHARS = 500
+CONTEXT_MAX_CHARS = 1500
+HISTORY_USER_MAX_CHARS = 200
+HISTORY_AI_MAX_CHARS = 300
+
+# Context retrieval runs on this pool so it overlaps with the rest of chat();
+# one worker per request thread so concurrent chats never queue for a lookup
+CONTEXT_WORKERS = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Context cache configuration
+CONTEXT_CACHE_MAX_ENTRIES = 2000
+CONTEXT_CACHE_TTL_SECONDS = 300  # Qdrant results go stale after 5 minutes
+CONTEXT_CACHE_SIMILARITY = 0.95  # Cosine similarity needed to reuse a near-duplicate query
+# Context caches are per process: restart the app after re-seeding the collection so old context is dropped
+
+# Common opening problems embedded (in one call) and looked up when a worker starts; their
+# context stays pinned in memory for the life of the worker instead of expiring with the cache
+CACHE_WARM_ON_STARTUP = os.getenv("CACHE_WARM_ON_STARTUP", "True").lower() == "true"
+HOT_QUERIES_FILE = os.getenv("HOT_QUERIES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "hot_queries.json"))
+
+# Response cache configuration
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+RESPONSE_CACHE_TTL_SECONDS = 600
+# Near-duplicate first coaching messages at the same turn and tone reuse the earlier reply; stricter than context reuse (above 1 disables)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.98))
+ANSWER_CACHE_MAX_ENTRIES = 256  # Per (tone, turn) bucket
+
+# Conversation keywords
+# The two greeting checks have always used slightly different word lists; keep them apart
+GREETING_WORDS = frozenset(['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'howdy'])  # Not a problem: no tone question
+GREETING_REPLY_WORDS = frozenset(['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'helo', 'hola'])  # First message gets the canned greeting
+TONE_OPTIONS = ("Professional", "Casual")
+# Messages that are never the user's actual problem when looking back after a tone pick
+PROBLEM_SKIP_MESSAGES = frozenset(['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'professional', 'casual', 'before i help you with this, how would you like me to respond?'])
+VIOLENCE_KEYWORDS = ('hit', 'punch', 'slap', 'kick', 'physical violence', 'physically hurt', 'assault', 'attack', 'threatened with violence')
+WORKLOAD_KEYWORDS = ('workload', 'work load', 'tasks', 'deadline', 'pressure', 'stress', 'overwhelm')
+PHYSICAL_INDICATORS = ('physically', 'hit me', 'hurt me', 'threatened', 'violence')
+HARMFUL_KEYWORDS = ('kill', 'murder', 'suicide', 'weapon', 'gun', 'knife', 'blood', 'stab', 'threat', 'harass')
+HEALTH_KEYWORDS = ('headache', 'sick', 'pain', 'fever', 'medication', 'doctor', 'hospital')
+
+def compile_keyword_pattern(keywords) -> re.Pattern:
+    """Compile keywords into one case-insensitive alternation (same substring semantics as `in`)"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+
+VIOLENCE_PATTERN = compile_keyword_pattern(VIOLENCE_KEYWORDS)
+WORKLOAD_PATTERN = compile_keyword_pattern(WORKLOAD_KEYWORDS)
+PHYSICAL_PATTERN = compile_keyword_pattern(PHYSICAL_INDICATORS)
+HARMFUL_PATTERN = compile_keyword_pattern(HARMFUL_KEYWORDS)
+HEALTH_PATTERN = compile_keyword_pattern(HEALTH_KEYWORDS)
+
+# Response formatting patterns (format_response runs on every AI reply)
+BOLD_MARKDOWN_PATTERN = re.compile(r'\*\*([^*]+)\*\*')
+EXCESS_BREAKS_PATTERN = re.compile(r'(<br>\s*){3,}')
+NUMBERED_BOLD_MARKDOWN_PATTERN = re.compile(r'(\d+)\.\s+\*\*([^*]+)\*\*')
+NUMBERED_BOLD_HTML_PATTERN = re.compile(r'(\d+)\.\s+<b>([^<]+)</b>')
+# Any letter or digit; messages without one ("???", "...") get a clarifying question instead of GPT
+ALPHANUMERIC_PATTERN = re.compile(r'[^\W_]')
+
+# ============================================================================
+# System Prompts
+# ============================================================================
+
+# One template for both tones; the per-tone wording is filled from TONE_PROMPT_PARTS
+SYSTEM_PROMPT_TEMPLATE = """You are a helpful workplace coach. NEVER mention frameworks or models.
+
+🎯 TONE: {tone_label}
+
+📋 CRITICAL RULES:
+
+**YOUR SCOPE:**
+- ONLY help with workplace challenges: communication, conflicts, career growth, team dynamics, work stress
+- If they ask about gossip, personal drama, or off-topic stuff → Redirect: "{redirect}"
+- If it's an emergency (violence, harassment, mental health crisis) → Give crisis resources, don't try to coach
+
+**CONVERSATION FLOW:**
+
+**FIRST RESPONSE (when problem shared):**
+- Acknowledge issue briefly (1 sentence)
+- If you need 1-2 key details to help, ask ONE specific question
+- If situation is clear, skip to solution immediately
+
+**AFTER 1-2 CLARIFYING QUESTIONS:**
+- STOP asking questions
+- Give practical advice (1-2 sentences)
+- If you lack specific company info (policies, procedures), acknowledge it: "{policy_note}"
+- End with simple yes/no question to keep engaged
+
+**EXAMPLE - Leave request:**
+User: "I want leave but used all my leave"
+You: "{leave_example}"
+
+**EXAMPLE - Redirect gossip:**
+User: "My coworker is dating the boss"
+You: "{redirect}"
+
+**EXAMPLE - Emergency redirect:**
+User: "I want to hurt myself"
+You: "{emergency_example}"
+
+**STYLE:**
+- Max 2-3 sentences
+{style}
+- NO robotic phrases: "It sounds like...", "I understand that...", "Thank you for sharing..."
+
+Relevant workplace examples (background only, don't quote them):
+{context}
+
+Chat History:
+{chat_history}
+
+Respond to the user's message in 2-3 sentences:"""
+
+TONE_PROMPT_PARTS = {
+    "Casual": {
+        'tone_label': "Casual (like a friendly colleague)",
+        'redirect': "I'm here to help with workplace challenges. What's something work-related that's been on your mind?",
+        'policy_note': "I don't have your company's specific leave policy, but here's what usually works...",
+        'leave_example': "That's tough. I don't have your company's specific policies, but you could try talking to your manager about unpaid leave or working from home if it's urgent. Is this for something time-sensitive?",
+        'emergency_example': "⚠️ Please reach out for immediate help: National Suicide Prevention Lifeline: 988. I'm designed for workplace challenges, not crisis support.",
+        'style': '- Sound like a human friend: "Honestly...", "Here\'s what I\'d try...", "You could..."\n'
+                 '- Use contractions: "you\'re", "don\'t", "can\'t"',
+    },
+    "Professional": {
+        'tone_label': "Professional (like a trusted mentor)",
+        'redirect': "I'm here to assist with workplace challenges. What work-related matter can I help you with?",
+        'policy_note': "I don't have access to your organization's specific policies, but typically you might...",
+        'leave_example': "That's certainly challenging. I don't have your organization's specific policies, but you might discuss options like unpaid leave or remote work with your supervisor if the need is urgent. Is this request time-sensitive?",
+        'emergency_example': "⚠️ Please seek immediate support: National Suicide Prevention Lifeline: 988. I'm designed for workplace challenges, not crisis intervention.",
+        'style': '- Professional but human: "I\'d suggest...", "Consider...", "You might..."',
+    },
+}
+
+def render_prompt_segments(tone_parts: dict) -> list:
+    """Render a tone's static prompt text once, split where context and chat history go"""
+    slots = {'context': '\0', 'chat_history': '\0'}
+    return SYSTEM_PROMPT_TEMPLATE.format_map({**tone_parts, **slots}).split('\0')
+
+# Per-request prompt building is then a single join of these with the dynamic values
+SYSTEM_PROMPT_SEGMENTS = {tone: render_prompt_segments(parts) for tone, parts in TONE_PROMPT_PARTS.items()}
+
+GENERATION_ERROR_RESPONSE = "Sorry, I'm having trouble generating a response right now. Please try again."
+
+# Fixed replies for turns that never reach GPT
+GREETING_RESPONSE = "Hello! How can I help you today?"
+TONE_ASK_RESPONSE = "Before I help you with this, how would you like me to respond?"
+ELABORATE_RESPONSE = "Could you tell me a bit more about what's going on?"
+
+# Pre-tone replies and their quick replies, keyed by whether the message is a real problem (3+ words)
+PRE_TONE_REPLIES = {
+    True: (TONE_ASK_RESPONSE, TONE_OPTIONS),
+    False: (ELABORATE_RESPONSE, ()),
+}
+
+VIOLENCE_RESPONSE = """⚠️ **This is serious.** Physical violence at work is illegal and unacceptable.
+
+Please take action immediately:
+• Document everything (dates, witnesses, injuries)
+• Report to HR or higher management NOW
+• Contact workplace violence hotline: 1-800-799-7233
+• If you're in immediate danger, call 911
+
+This isn't a communication issue — it's workplace abuse. I can't coach you through this, but I strongly urge you to protect yourself and report this."""
+
+HARMFUL_RESPONSE = """⚠️ I'm concerned about what you've shared. If you're in immediate danger or witnessing illegal activity, please contact:
+
+• Emergency Services: 911
+• National Suicide Prevention Lifeline: 988
+• Workplace Violence Hotline: 1-800-799-7233
+
+I'm designed to help with workplace communication challenges, not crisis or safety situations. Please reach out to professionals who can provide proper support."""
+
+HEALTH_RESPONSE = "I'm specifically designed for workplace communication challenges. For health concerns, please consult a medical professional. Can we focus on a work-related communication or teamwork challenge instead?"
+
+# Every reply the app writes itself; history made only of these has no GPT-written turns
+FIXED_RESPONSES = frozenset([
+    GREETING_RESPONSE, TONE_ASK_RESPONSE, ELABORATE_RESPONSE,
+    VIOLENCE_RESPONSE, HARMFUL_RESPONSE, HEALTH_RESPONSE, GENERATION_ERROR_RESPONSE
+])
 
 # Global variables
 qdrant_client = None
 openai_client = None
+redis_client = None
 
 def initialize_services():
-    """Initialize Qdrant and OpenAI services"""
-    global qdrant_client, openai_client
+    """Initialize Qdrant, OpenAI and (optionally) Redis services"""
+    global qdrant_client, openai_client, redis_client
     
     try:
         logger.info("🔌 Connecting to services...")
         
-        # Initialize Qdrant client
+        # Initialize Qdrant client (gRPC: binary vectors over one multiplexed HTTP/2 connection)
         qdrant_client = QdrantClient(
             url=QDRANT_URL,
             api_key=QDRANT_API_KEY,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
+            grpc_options=QDRANT_GRPC_OPTIONS,
+            limits=HTTP_POOL_LIMITS,  # Used by REST-only calls
             timeout=10  # 10 second timeout
         )
         
         # Initialize OpenAI client (for embeddings AND chat) with timeout
+        # A persistent HTTP/2 pool lets embedding and chat calls reuse one TLS connection
         openai_client = OpenAI(
             api_key=OPENAI_API_KEY,
-            timeout=30.0  # 30 second timeout for API calls
+            timeout=30.0,  # 30 second timeout for API calls
+            http_client=DefaultHttpxClient(
+                http2=True,
+                limits=HTTP_POOL_LIMITS
+            )
         )
         
+        # Server-side chat history: tokens then only carry a session id
+        if REDIS_URL:
+            redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            logger.info("🗄️ Chat history stored in Redis")
+        
         logger.info("✅ All services initialized successfully")
         return True
         
@@ -75,36 +349,82 @@ def initialize_services():
         logger.error(f"❌ Failed to initialize services: {str(e)}")
         return False
 
+# ============================================================================
+# Timestamps
+# ============================================================================
+
+# (second, formatted) pair; replaced as a whole so concurrent readers never see a torn value
+_timestamp_cache = (0, "")
+
+def now_iso() -> str:
+    """Current UTC time as an ISO string at second granularity, formatted at most once per second"""
+    global _timestamp_cache
+    second = int(time.time())
+    cached_second, formatted = _timestamp_cache
+    if cached_second != second:
+        formatted = datetime.utcfromtimestamp(second).isoformat()
+        _timestamp_cache = (second, formatted)
+    return formatted
+
+def format_timestamp(timestamp) -> str:
+    """Format a stored epoch-seconds timestamp as ISO (older entries already hold ISO strings)"""
+    if isinstance(timestamp, str):
+        return timestamp
+    return datetime.utcfromtimestamp(timestamp).isoformat(timespec='seconds')
+
 # ============================================================================
 # JWT Token Functions
 # ============================================================================
 
-def create_token(chat_history: list = None, tone: str = None) -> str:
-    """Create a new JWT token with chat session data"""
+def create_token(chat_history: list = None, tone: str = None, session_id: str = None, message_count: int = None, pending_problem: str = None) -> str:
+    """Create a new JWT token with chat session data (or just a session id when history is in Redis)"""
     payload = {
-        'chat_history': chat_history or [],
         'tone': tone,
-        'created_at': datetime.utcnow().isoformat(),
+        # Lets the message limit be checked without loading the history
+        'message_count': len(chat_history or []) if message_count is None else message_count,
+        'created_at': now_iso(),
         'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
     }
+    if pending_problem:
+        # The problem awaiting a tone choice, so tone selection needs no history scan
+        payload['pending_problem'] = pending_problem
+    if session_id:
+        payload['session_id'] = session_id
+    else:
+        payload['chat_history'] = chat_history or []
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return token
 
-def decode_token(token: str) -> dict:
-    """Decode and validate JWT token, return session data"""
+def decode_token(token: str, include_history: bool = True) -> dict:
+    """Decode and validate JWT token, return session data
+    
+    With include_history=False, Redis-backed history is not loaded and chat_history is None.
+    """
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        session_id = payload.get('session_id')
+        if session_id and redis_client:
+            chat_history = load_history(session_id) if include_history else None
+        else:
+            chat_history = payload.get('chat_history', [])
         return {
-            'chat_history': payload.get('chat_history', []),
+            'chat_history': chat_history,
             'tone': payload.get('tone'),
+            'session_id': session_id,
+            'message_count': payload.get('message_count', len(payload.get('chat_history', []))),
+            'pending_problem': payload.get('pending_problem'),
             'valid': True
         }
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
-        return {'chat_history': [], 'tone': None, 'valid': False, 'error': 'Token expired'}
+        return {'chat_history': [], 'tone': None, 'session_id': None, 'message_count': 0, 'pending_problem': None, 'valid': False, 'error': 'Token expired'}
     except jwt.InvalidTokenError as e:
         logger.warning(f"Invalid token: {str(e)}")
-        return {'chat_history': [], 'tone': None, 'valid': False, 'error': 'Invalid token'}
+        return {'chat_history': [], 'tone': None, 'session_id': None, 'message_count': 0, 'pending_problem': None, 'valid': False, 'error': 'Invalid token'}
+
+def new_session_id():
+    """Return a fresh session id when history is stored in Redis, otherwise None"""
+    return uuid.uuid4().hex if redis_client else None
 
 def get_token_from_request() -> str:
     """Extract token from Authorization header or request body"""
@@ -117,285 +437,567 @@ def get_token_from_request() -> str:
     data = request.get_json() or {}
     return data.get('token', '')
 
-def get_relevant_context(user_message: str, top_k: int = 3) -> str:
-    """Retrieve relevant context from Qdrant using OpenAI embeddings"""
-    try:
-        # Skip Qdrant if not available
-        if not qdrant_client:
-            logger.warning("Qdrant client not initialized")
-            return "No context available."
-            
-        # Generate embedding using OpenAI - Reduce dimensions to 768 to match Qdrant
-        # text-embedding-3-small supports dimension parameter to reduce from 1536 to 768
-        embedding_response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=user_message,
-            dimensions=768  # Reduce to 768 to match Qdrant collection
-        )
-        query_vector = embedding_response.data[0].embedding
-        
-        logger.info(f"Generated embedding with {len(query_vector)} dimensions")
-        
-        # Search in Qdrant
-        search_results = qdrant_client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=top_k
-        )
-        
-        logger.info(f"Found {len(search_results)} results from Qdrant")
-        
-        # Extract context from results
-        context_parts = []
-        for idx, result in enumerate(search_results):
-            if hasattr(result, 'payload') and result.payload:
-                # Log what fields exist in the payload
-                logger.info(f"Result {idx+1} payload keys: {list(result.payload.keys())}")
-                
-                # Try common field names for text content
-                text = (result.payload.get('text') or 
-                       result.payload.get('page_content') or 
-                       result.payload.get('content') or
-                       result.payload.get('scenario') or
-                       result.payload.get('description') or '')
-                
-                if text:
-                    context_parts.append(text)
-                    logger.info(f"  ✓ Found text in result {idx+1}: {text[:100]}...")
-                else:
-                    logger.warning(f"  ✗ No text found in result {idx+1} payload: {result.payload}")
-        
-        if context_parts:
-            logger.info(f"✅ Successfully retrieved {len(context_parts)} context items from Qdrant")
-            return "\n\n".join(context_parts)
-        else:
-            logger.warning("No context found in Qdrant results")
-            return "No relevant context found."
-        
-    except Exception as e:
-        # This is a critical error - bot SHOULD use Qdrant context
-        logger.error(f"❌ CRITICAL: Failed to get Qdrant context: {str(e)}")
-        return "No context available."
+# ============================================================================
+# Caches
+# ============================================================================
 
-def generate_response(user_message: str, context: str, chat_history: str = "", tone: str = None, chat_length: int = 0) -> str:
-    """Generate response using GPT-4o-mini with STEP + 4Rs framework and Qdrant context"""
-    try:
-        # Check if this is a greeting (first message ONLY)
-        greeting_words = ['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'helo', 'hola']
-        if user_message.lower().strip() in greeting_words and chat_length <= 1:
-            # Return friendly, natural greeting (no tone needed for greetings)
-            return "Hello! How can I help you today?"
-        
-        # Safety check - Physical violence/abuse (CRITICAL) - Only if it's clearly physical violence
-        # Improved: Check for context to avoid false positives (e.g., "beat me in workload")
-        violence_keywords = ['hit', 'punch', 'slap', 'kick', 'physical violence', 'physically hurt', 'assault', 'attack', 'threatened with violence']
-        workload_context = ['workload', 'work load', 'tasks', 'deadline', 'pressure', 'stress', 'overwhelm']
-        
-        # Only trigger violence warning if violence keywords found AND no workload context
-        has_violence_keyword = any(keyword in user_message.lower() for keyword in violence_keywords)
-        has_workload_context = any(keyword in user_message.lower() for keyword in workload_context)
-        
-        # Special check for "beat" - only warn if it's clearly physical, not metaphorical
-        if 'beat' in user_message.lower() and not has_workload_context:
-            # Check if it's physical violence context
-            physical_indicators = ['physically', 'hit me', 'hurt me', 'threatened', 'violence']
-            if any(indicator in user_message.lower() for indicator in physical_indicators):
-                return """⚠️ **This is serious.** Physical violence at work is illegal and unacceptable.
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire a fixed time after being stored"""
 
-Please take action immediately:
-• Document everything (dates, witnesses, injuries)
-• Report to HR or higher management NOW
-• Contact workplace violence hotline: 1-800-799-7233
-• If you're in immediate danger, call 911
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
 
-This isn't a communication issue — it's workplace abuse. I can't coach you through this, but I strongly urge you to protect yourself and report this."""
-        
-        # Regular violence keywords (excluding 'beat' which is handled above)
-        if has_violence_keyword and not has_workload_context:
-            return """⚠️ **This is serious.** Physical violence at work is illegal and unacceptable.
+    def get(self, key):
+        """Return the cached value for a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
 
-Please take action immediately:
-• Document everything (dates, witnesses, injuries)
-• Report to HR or higher management NOW
-• Contact workplace violence hotline: 1-800-799-7233
-• If you're in immediate danger, call 911
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
 
-This isn't a communication issue — it's workplace abuse. I can't coach you through this, but I strongly urge you to protect yourself and report this."""
-        
-        # Safety check - Harmful content
-        harmful_keywords = ['kill', 'murder', 'suicide', 'weapon', 'gun', 'knife', 'blood', 'stab', 'threat', 'harass']
-        if any(keyword in user_message.lower() for keyword in harmful_keywords):
-            return """⚠️ I'm concerned about what you've shared. If you're in immediate danger or witnessing illegal activity, please contact:
 
-• Emergency Services: 911
-• National Suicide Prevention Lifeline: 988
-• Workplace Violence Hotline: 1-800-799-7233
+class SemanticCache:
+    """Thread-safe cache of Qdrant context, looked up by exact message or by embedding similarity"""
 
-I'm designed to help with workplace communication challenges, not crisis or safety situations. Please reach out to professionals who can provide proper support."""
-        
-        # Safety check - Health issues
-        health_keywords = ['headache', 'sick', 'pain', 'fever', 'medication', 'doctor', 'hospital']
-        if any(keyword in user_message.lower() for keyword in health_keywords):
-            return "I'm specifically designed for workplace communication challenges. For health concerns, please consult a medical professional. Can we focus on a work-related communication or teamwork challenge instead?"
-        
-        # Define tone-specific instructions
-        tone_instruction = ""
-        if tone == "Casual":
-            tone_instruction = """
-🎯 YOU MUST USE CASUAL/FRIENDLY TONE:
-- Write like you're texting a friend - use "gonna", "wanna", "that sucks", "ugh"
-- NEVER use formal phrases like "I understand", "Let us", "effectively", "navigate"
-- Keep it SHORT and conversational
-- Use contractions always: "you're", "don't", "can't", "it's"
-"""
-        elif tone == "Professional":
-            tone_instruction = """
-🎯 YOU MUST USE PROFESSIONAL TONE:
-- Sound like a workplace mentor - clear, respectful, structured
-- Use complete sentences and proper grammar
-- Professional but warm and supportive
-"""
-        else:
-            # NO TONE SELECTED - ASK QUESTIONS ONLY
-            tone_instruction = """
-🎯 NO TONE SELECTED - YOU MUST ASK QUESTIONS:
-- User hasn't picked tone yet
-- DO NOT give advice or frameworks yet
-- Ask 1-2 brief questions to understand their situation
-- Keep it neutral and friendly
-"""
-        
-        # Build system prompt - ONLY for when tone is selected
-        if tone == "Casual":
-            system_prompt = f"""You are a helpful workplace coach. NEVER mention frameworks or models.
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # key -> (expires_at, row, context)
+        self._vectors = None  # (max_entries, dim) int8 matrix of quantized unit-length query vectors
+        self._scales = np.zeros(max_entries, dtype=np.float32)  # Per-row dequantization scale
+        self._row_keys = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.RLock()
 
-Chat History:
-{chat_history}
+    @staticmethod
+    def make_key(user_message: str) -> str:
+        """Normalize a message into an exact-match cache key"""
+        return hashlib.sha1(user_message.strip().lower().encode('utf-8')).hexdigest()
 
-Current user message: "{user_message}"
+    def get(self, key: str):
+        """Return cached context for an exact key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
 
-🎯 TONE: Casual (like a friendly colleague)
+    def get_similar(self, query_vector):
+        """Return cached context for the nearest cached query vector above the threshold, or None"""
+        with self._lock:
+            if not self._entries:
+                return None
+            query = self._normalize(query_vector)
+            if query.shape[0] != self._vectors.shape[1]:
+                return None
+            similarities = (self._vectors @ query) * self._scales
+            best_row = int(np.argmax(similarities))
+            best_key = self._row_keys[best_row]
+            if best_key is None or similarities[best_row] < self.similarity_threshold:
+                return None
+            return self.get(best_key)
 
-📋 CRITICAL RULES:
+    def put(self, key: str, query_vector, context: str):
+        """Store context for a key and its query vector, evicting the least recently used entry when full"""
+        with self._lock:
+            query = self._normalize(query_vector)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.int8)
+            if key in self._entries:
+                self._evict(key)
+            if not self._free_rows:
+                self._evict(next(iter(self._entries)))
+            row = self._free_rows.pop()
+            # int8 with a per-row scale keeps cosine scores accurate at a quarter of the float32 size
+            scale = float(np.max(np.abs(query))) / 127 or 1.0
+            self._vectors[row] = np.round(query / scale).astype(np.int8)
+            self._scales[row] = scale
+            self._row_keys[row] = key
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, row, context)
 
-**YOUR SCOPE:**
-- ONLY help with workplace challenges: communication, conflicts, career growth, team dynamics, work stress
-- If they ask about gossip, personal drama, or off-topic stuff → Redirect: "I'm here to help with workplace challenges. What's something work-related that's been on your mind?"
-- If it's an emergency (violence, harassment, mental health crisis) → Give crisis resources, don't try to coach
+    def _evict(self, key: str):
+        _, row, _ = self._entries.pop(key)
+        self._vectors[row] = 0
+        self._scales[row] = 0.0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
 
-**CONVERSATION FLOW:**
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
 
-**FIRST RESPONSE (when problem shared):**
-- Acknowledge issue briefly (1 sentence)
-- If you need 1-2 key details to help, ask ONE specific question
-- If situation is clear, skip to solution immediately
+context_cache = SemanticCache(CONTEXT_CACHE_MAX_ENTRIES, CONTEXT_CACHE_TTL_SECONDS, CONTEXT_CACHE_SIMILARITY)
+hot_context = {}  # Pinned context for common opening problems, filled at startup
+response_cache = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+answer_caches = {}  # (tone, chat length) -> SemanticCache of formatted GPT replies
+answer_caches_lock = threading.Lock()
 
-**AFTER 1-2 CLARIFYING QUESTIONS:**
-- STOP asking questions
-- Give practical advice (1-2 sentences)
-- If you lack specific company info (policies, procedures), acknowledge it: "I don't have your company's specific leave policy, but here's what usually works..."
-- End with simple yes/no question to keep engaged
+def answer_cache(tone: str, chat_length: int) -> SemanticCache:
+    """Return the near-duplicate reply cache for one tone and turn, creating it on first use"""
+    bucket = ("Casual" if tone == "Casual" else "Professional", chat_length)
+    with answer_caches_lock:
+        cache = answer_caches.get(bucket)
+        if cache is None:
+            cache = answer_caches[bucket] = SemanticCache(ANSWER_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+        return cache
 
-**EXAMPLE - Leave request:**
-User: "I want leave but used all my leave"
-You: "That's tough. I don't have your company's specific policies, but you could try talking to your manager about unpaid leave or working from home if it's urgent. Is this for something time-sensitive?"
+def response_cache_key(user_message: str, context: str, chat_history: str = "", tone: str = None) -> bytes:
+    """Key a GPT reply by everything that goes into its prompt"""
+    parts = (user_message.strip().lower(), tone or "", context, chat_history)
+    return hashlib.blake2b("\0".join(parts).encode('utf-8'), digest_size=16).digest()
 
-**EXAMPLE - Redirect gossip:**
-User: "My coworker is dating the boss"
-You: "I'm here to help with workplace challenges. What's something work-related that's been on your mind?"
+# ============================================================================
+# Embedding Batcher
+# ============================================================================
 
-**EXAMPLE - Emergency redirect:**
-User: "I want to hurt myself"
-You: "⚠️ Please reach out for immediate help: National Suicide Prevention Lifeline: 988. I'm designed for workplace challenges, not crisis support."
+_embedding_encoding = None  # Loaded on first use; False once loading has failed
+_embedding_encoding_lock = threading.Lock()
 
-**STYLE:**
-- Max 2-3 sentences
-- Sound like a human friend: "Honestly...", "Here's what I'd try...", "You could..."
-- Use contractions: "you're", "don't", "can't"
-- NO robotic phrases: "It sounds like...", "I understand that...", "Thank you for sharing..."
+def get_embedding_encoding():
+    """Return the embedding model's tokenizer, or None if it could not be loaded (tried only once)"""
+    global _embedding_encoding
+    if _embedding_encoding is None:
+        with _embedding_encoding_lock:
+            if _embedding_encoding is None:
+                try:
+                    _embedding_encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+                except Exception as e:
+                    # The vocabulary is downloaded on first use; don't retry that fetch on every long message
+                    logger.warning(f"Tokenizer unavailable, long messages will be clipped by bytes: {str(e)}")
+                    _embedding_encoding = False
+    return _embedding_encoding or None
 
-Respond in 2-3 sentences:"""
-        else:  # Professional  
-            system_prompt = f"""You are a helpful workplace coach. NEVER mention frameworks or models.
+def truncate_for_embedding(text: str) -> str:
+    """Clip a text to the embedding model's per-input token limit"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= EMBEDDING_MAX_TOKENS:
+        return text  # Every token covers at least one byte, so short texts never need counting
+    encoding = get_embedding_encoding()
+    if encoding is None:
+        # Clipping by bytes is always within the token limit
+        return encoded[:EMBEDDING_MAX_TOKENS].decode('utf-8', errors='ignore')
+    tokens = encoding.encode(text)
+    if len(tokens) <= EMBEDDING_MAX_TOKENS:
+        return text
+    logger.warning(f"✂️ Truncated a {len(tokens)}-token message for embedding")
+    return encoding.decode(tokens[:EMBEDDING_MAX_TOKENS])
 
-Chat History:
-{chat_history}
+class EmbeddingBatcher:
+    """Coalesce embedding requests from concurrent chats into a single OpenAI call"""
 
-Current user message: "{user_message}"
+    def __init__(self, max_batch_size: int, max_wait_ms: int):
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
 
-🎯 TONE: Professional (like a trusted mentor)
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the returned future resolves to its vector"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((truncate_for_embedding(text), future))
+        return future
 
-📋 CRITICAL RULES:
+    def _ensure_worker(self):
+        # Started lazily so every gunicorn worker process gets its own thread
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._worker_pid != os.getpid():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
 
-**YOUR SCOPE:**
-- ONLY help with workplace challenges: communication, conflicts, career growth, team dynamics, work stress
-- If they ask about gossip, personal drama, or off-topic stuff → Redirect: "I'm here to assist with workplace challenges. What work-related matter can I help you with?"
-- If it's an emergency (violence, harassment, mental health crisis) → Give crisis resources, don't try to coach
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._embed_batch(batch)
 
-**CONVERSATION FLOW:**
+    def _embed_batch(self, batch: list):
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        
+        # Similar-length inputs together keep server-side padding low
+        batch.sort(key=lambda item: len(item[0]))
+        try:
+            embedding_response = openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[text for text, _ in batch],
+                dimensions=EMBEDDING_DIMENSIONS
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        if len(batch) > 1:
+            logger.info(f"📦 Embedded {len(batch)} messages in one batch")
+        for (_, future), item in zip(batch, embedding_response.data):
+            future.set_result(item.embedding)
 
-**FIRST RESPONSE (when problem shared):**
-- Acknowledge issue briefly (1 sentence)
-- If you need 1-2 key details to help, ask ONE specific question
-- If situation is clear, skip to solution immediately
+embedding_batcher = EmbeddingBatcher(EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_WAIT_MS)
+embedding_cache = TTLCache(EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_TTL_SECONDS)
 
-**AFTER 1-2 CLARIFYING QUESTIONS:**
-- STOP asking questions
-- Give practical advice (1-2 sentences)
-- If you lack specific company info (policies, procedures), acknowledge it: "I don't have access to your organization's specific policies, but typically you might..."
-- End with simple yes/no question to keep engaged
+def embedding_cache_key(text: str) -> bytes:
+    """Content-address an embedding by model, dimensions and text"""
+    return hashlib.blake2b(f"{EMBEDDING_MODEL}\0{EMBEDDING_DIMENSIONS}\0{text}".encode('utf-8'), digest_size=16).digest()
 
-**EXAMPLE - Leave request:**
-User: "I want leave but used all my leave"
-You: "That's certainly challenging. I don't have your organization's specific policies, but you might discuss options like unpaid leave or remote work with your supervisor if the need is urgent. Is this request time-sensitive?"
+def cached_embedding(text: str):
+    """Return the cached vector for a text without calling OpenAI, or None"""
+    vector = embedding_cache.get(embedding_cache_key(text))
+    return None if vector is None else vector.astype(np.float32)
 
-**EXAMPLE - Redirect gossip:**
-User: "My coworker is dating the boss"
-You: "I'm here to assist with workplace challenges. What work-related matter can I help you with?"
+def embed_text(text: str) -> np.ndarray:
+    """Embed a text, reusing the vector from an earlier identical text when cached"""
+    vector = cached_embedding(text)
+    if vector is None:
+        vector = np.asarray(embedding_batcher.submit(text).result(timeout=EMBEDDING_TIMEOUT_SECONDS), dtype=np.float32)
+        embedding_cache.put(embedding_cache_key(text), vector.astype(np.float16))
+    return vector
 
-**EXAMPLE - Emergency redirect:**
-User: "I want to hurt myself"
-You: "⚠️ Please seek immediate support: National Suicide Prevention Lifeline: 988. I'm designed for workplace challenges, not crisis intervention."
+def embed_batch(texts: list) -> list:
+    """Embed many texts with as few OpenAI calls as possible, reusing cached vectors"""
+    keys = [embedding_cache_key(text) for text in texts]
+    vectors = [embedding_cache.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    vectors = [None if vector is None else vector.astype(np.float32) for vector in vectors]
+    for start in range(0, len(missing), EMBEDDING_REQUEST_MAX_INPUTS):
+        chunk = missing[start:start + EMBEDDING_REQUEST_MAX_INPUTS]
+        embedding_response = openai_client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=[truncate_for_embedding(texts[i]) for i in chunk],
+            dimensions=EMBEDDING_DIMENSIONS
+        )
+        for i, item in zip(chunk, embedding_response.data):
+            vectors[i] = np.asarray(item.embedding, dtype=np.float32)
+            embedding_cache.put(keys[i], vectors[i].astype(np.float16))
+    return vectors
+context_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix="context")
+# Background Redis history writes (single-worker deployments only); one writer keeps each session's entries in order
+history_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+pending_history_writes = {}  # session id -> its latest queued write, so this process reads its own writes
 
-**STYLE:**
-- Max 2-3 sentences
-- Professional but human: "I'd suggest...", "Consider...", "You might..."
-- NO robotic phrases: "It sounds like...", "I understand that...", "Thank you for sharing..."
+# ============================================================================
+# Chat History Storage
+# ============================================================================
 
-Respond in 2-3 sentences:"""
+def load_history(session_id: str, last: int = None) -> list:
+    """Load a session's chat history (or only its last few entries) from Redis"""
+    pending = pending_history_writes.get(session_id)
+    if pending is not None:
+        pending.result()
+    start = -last if last else 0
+    return [orjson.loads(entry) for entry in redis_client.lrange(HISTORY_KEY_PREFIX + session_id, start, -1)]
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.7,  # Higher for more natural/varied responses
-            max_tokens=250  # Increased for complete 4-step responses
-        )
+def format_chat_history(history: list) -> str:
+    """Render the last few exchanges as the prompt's User:/AI: transcript"""
+    return "\n".join([
+        f"User: {h['user'][:HISTORY_USER_MAX_CHARS]}\nAI: {h['ai'][:HISTORY_AI_MAX_CHARS]}" for h in history[-HISTORY_PROMPT_EXCHANGES:]
+    ])
+
+def append_history(history: list, entry: dict, session_id: str = None):
+    """Append an exchange to the history, pushing only the new entry to Redis when enabled"""
+    history.append(entry)
+    if session_id and redis_client:
+        if not HISTORY_WRITE_IN_BACKGROUND:
+            # Errors propagate so a lost write fails the turn instead of silently dropping history
+            write_history_entry(session_id, orjson.dumps(entry))
+            return
+        # Single worker: the write happens after the response is sent and load_history waits for it.
+        # A failed background write can only be logged
+        future = history_writer.submit(write_history_entry_in_background, session_id, orjson.dumps(entry))
+        pending_history_writes[session_id] = future
+        future.add_done_callback(lambda done: forget_history_write(session_id, done))
+
+def forget_history_write(session_id: str, future: Future):
+    """Drop a finished write from pending_history_writes unless a newer one replaced it"""
+    if pending_history_writes.get(session_id) is future:
+        pending_history_writes.pop(session_id, None)
+
+def write_history_entry(session_id: str, serialized_entry: bytes):
+    """Push one serialized exchange onto the session's Redis list"""
+    key = HISTORY_KEY_PREFIX + session_id
+    # Bounded and expiring with the token that points at it; all commands go out in one round trip
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(key, serialized_entry)
+    pipe.ltrim(key, -FREE_MESSAGE_LIMIT, -1)
+    pipe.expire(key, JWT_EXPIRATION_HOURS * 3600)
+    pipe.execute()
+
+def write_history_entry_in_background(session_id: str, serialized_entry: bytes):
+    """Run write_history_entry on history_writer, logging failures (nobody is waiting to see them)"""
+    try:
+        write_history_entry(session_id, serialized_entry)
+    except Exception as e:
+        logger.error(f"❌ Failed to save history for session {session_id}: {str(e)}")
+
+def payload_text(payload: dict) -> str:
+    """Return the first non-empty text field of a Qdrant payload"""
+    return next((payload[field] for field in CONTEXT_PAYLOAD_FIELDS if payload.get(field)), '')
+
+def get_relevant_context(user_message: str, top_k: int = 3) -> str:
+    """Retrieve relevant context from Qdrant using OpenAI embeddings"""
+    try:
+        # Skip Qdrant if not available
+        if not qdrant_client:
+            logger.warning("Qdrant client not initialized")
+            return "No context available."
+        
+        # Repeated messages (topic buttons, common questions) skip embedding and search entirely
+        cache_key = SemanticCache.make_key(user_message)
+        cached_context = hot_context.get(cache_key)
+        if cached_context is not None:
+            logger.info("⚡ Context prefetch hit")
+            return cached_context
+        cached_context = context_cache.get(cache_key)
+        if cached_context is not None:
+            logger.info("⚡ Context cache hit (exact match)")
+            return cached_context
+            
+        # Generate embedding using OpenAI (batched with other in-flight chats) unless already cached
+        query_vector = embed_text(user_message)
+        
+        logger.info(f"Generated embedding with {len(query_vector)} dimensions")
+        
+        # Near-duplicate messages reuse the context of a previously seen query. It is not stored again under
+        # this query: that would chain matches away from the original and keep its context past the TTL
+        cached_context = context_cache.get_similar(query_vector)
+        if cached_context is not None:
+            logger.info("⚡ Context cache hit (similar query)")
+            return cached_context
+        
+        context = search_context(query_vector, top_k)
+        context_cache.put(cache_key, query_vector, context)
+        return context
+        
+    except Exception as e:
+        # This is a critical error - bot SHOULD use Qdrant context
+        logger.error(f"❌ CRITICAL: Failed to get Qdrant context: {str(e)}")
+        return "No context available."
+
+def search_context(query_vector, top_k: int = 3) -> str:
+    """Search Qdrant with an embedded query and join the matching scenario texts"""
+    search_results = qdrant_client.query_points(
+        collection_name=COLLECTION_NAME,
+        query=query_vector,
+        limit=top_k,
+        score_threshold=QDRANT_SCORE_THRESHOLD,
+        search_params=QDRANT_SEARCH_PARAMS,
+        with_payload=CONTEXT_PAYLOAD_FIELDS,
+        with_vectors=False
+    ).points
+    
+    logger.info(f"Found {len(search_results)} results from Qdrant")
+    
+    # Extract context from results (payloads only carry CONTEXT_PAYLOAD_FIELDS)
+    context_parts = [text[:CONTEXT_ITEM_MAX_CHARS] for text in (payload_text(result.payload) for result in search_results if result.payload) if text]
+    if len(context_parts) < len(search_results):
+        logger.warning(f"  ✗ {len(search_results) - len(context_parts)} result(s) had no text in their payload")
+    
+    if context_parts:
+        logger.info(f"✅ Successfully retrieved {len(context_parts)} context items from Qdrant")
+        return "\n\n".join(context_parts)[:CONTEXT_MAX_CHARS]
+    logger.warning("No context found in Qdrant results")
+    return "No relevant context found."
+
+def warm_connections() -> None:
+    """Open the OpenAI, Qdrant and Redis connections so the first chat skips the TLS handshakes"""
+    try:
+        openai_client.models.retrieve(CHAT_MODEL)  # Free call on the same pool as embeddings and chat
+        qdrant_client.get_collection(COLLECTION_NAME)
+        if redis_client is not None:
+            redis_client.ping()
+        logger.info("🔥 Warmed service connections")
+    except Exception as e:
+        logger.warning(f"Connection warm-up skipped: {str(e)}")
+
+def load_hot_queries(path: str) -> list:
+    """Read the list of common opening problems to prefetch"""
+    with open(path, encoding='utf-8') as f:
+        return [query for query in orjson.loads(f.read()) if query.strip()]
+
+def warm_context_cache(queries) -> None:
+    """Embed common queries in one call and pin their context ahead of real traffic"""
+    try:
+        queries = list(queries)
+        for query, vector in zip(queries, embed_batch(queries)):
+            context = search_context(vector)
+            cache_key = SemanticCache.make_key(query)
+            hot_context[cache_key] = context
+            context_cache.put(cache_key, vector, context)  # Near-duplicates still go through the similarity lookup
+        logger.info(f"🔥 Prefetched context for {len(queries)} common queries")
+    except Exception as e:
+        logger.warning(f"Cache warm-up skipped: {str(e)}")
+
+def canned_response(user_message: str, chat_length: int = 0, msg_lower: str = None):
+    """Return a fixed reply for greetings, empty-content messages and safety triggers, or None when GPT should answer"""
+    # Lowercase once (callers that already have it pass msg_lower); every check below reuses it
+    if msg_lower is None:
+        msg_lower = user_message.strip().lower()
+    
+    # Check if this is a greeting (first message ONLY)
+    if msg_lower in GREETING_REPLY_WORDS and chat_length <= 1:
+        # Return friendly, natural greeting (no tone needed for greetings)
+        return GREETING_RESPONSE
+    
+    # Punctuation- or emoji-only messages have nothing for GPT to coach on
+    if not ALPHANUMERIC_PATTERN.search(msg_lower):
+        return ELABORATE_RESPONSE
+    
+    # Safety check - Physical violence/abuse (CRITICAL) - Only if it's clearly physical violence
+    # Improved: Check for context to avoid false positives (e.g., "beat me in workload")
+    # Only trigger violence warning if violence keywords found AND no workload context.
+    # "beat" alone is often metaphorical, so it also needs a physical indicator.
+    is_violent = VIOLENCE_PATTERN.search(msg_lower) or ('beat' in msg_lower and PHYSICAL_PATTERN.search(msg_lower))
+    if is_violent and not WORKLOAD_PATTERN.search(msg_lower):
+        return VIOLENCE_RESPONSE
+    
+    # Safety check - Harmful content
+    if HARMFUL_PATTERN.search(user_message):
+        return HARMFUL_RESPONSE
+    
+    # Safety check - Health issues
+    if HEALTH_PATTERN.search(user_message):
+        return HEALTH_RESPONSE
+    
+    return None
+
+# Held for the whole completion, including every chunk of a streamed reply
+chat_slots = threading.BoundedSemaphore(CHAT_MAX_CONCURRENCY)
+
+def build_chat_messages(user_message: str, context: str, chat_history: str = "", tone: str = None) -> list:
+    """Build the GPT-4o-mini message list for a coaching reply"""
+    # Static rules come first in the template so OpenAI's prompt cache can reuse the prefix
+    prefix, after_context, end = SYSTEM_PROMPT_SEGMENTS["Casual" if tone == "Casual" else "Professional"]
+    system_prompt = "".join((prefix, context, after_context, chat_history, end))
+    # The message itself goes only in the user turn, not repeated in the system prompt
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
+
+def has_gpt_turns(history: list) -> bool:
+    """True when any exchange shown in the prompt carries a reply GPT wrote"""
+    return any(h['ai'] not in FIXED_RESPONSES for h in history[-HISTORY_PROMPT_EXCHANGES:])
+
+def get_cached_reply(cache_key: bytes, user_message: str, tone: str = None, chat_length: int = 0, reuse_similar: bool = False):
+    """Return the reply for an identical prompt, or (when allowed) for a near-identical message at the same turn, or None"""
+    reply = response_cache.get(cache_key)
+    if reply is not None:
+        logger.info("⚡ Response cache hit")
+        return reply
+    if not reuse_similar or ANSWER_CACHE_SIMILARITY > 1:
+        return None
+    # Only a vector retrieval already produced; an extra embedding call would cost more than it saves
+    query_vector = cached_embedding(user_message)
+    if query_vector is None:
+        return None
+    reply = answer_cache(tone, chat_length).get_similar(query_vector)
+    if reply is not None:
+        logger.info("⚡ Answer cache hit (similar message)")
+    return reply
+
+def cache_reply(cache_key: bytes, user_message: str, reply: str, tone: str = None, chat_length: int = 0, reuse_similar: bool = False):
+    """Remember a GPT reply for identical prompts and (when allowed) for near-identical messages"""
+    response_cache.put(cache_key, reply)
+    if not reuse_similar or ANSWER_CACHE_SIMILARITY > 1:
+        return
+    query_vector = cached_embedding(user_message)
+    if query_vector is not None:
+        answer_cache(tone, chat_length).put(SemanticCache.make_key(user_message), query_vector, reply)
+
+def generate_response(user_message: str, context: str, chat_history: str = "", tone: str = None, chat_length: int = 0, reuse_similar: bool = False) -> str:
+    """Generate response using GPT-4o-mini with STEP + 4Rs framework and Qdrant context"""
+    try:
+        # Identical prompts, or near-identical first coaching messages at the same turn and tone, reuse the earlier reply
+        cache_key = response_cache_key(user_message, context, chat_history, tone)
+        cached_reply = get_cached_reply(cache_key, user_message, tone, chat_length, reuse_similar)
+        if cached_reply is not None:
+            return cached_reply
+        
+        with chat_slots:
+            response = openai_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=build_chat_messages(user_message, context, chat_history, tone),
+                temperature=CHAT_TEMPERATURE,
+                max_tokens=CHAT_MAX_TOKENS,
+                stop=CHAT_STOP_SEQUENCES
+            )
         
         raw_response = response.choices[0].message.content.strip()
         
         # POST-PROCESS: Force proper formatting if GPT didn't follow instructions
         formatted_response = format_response(raw_response)
         
+        cache_reply(cache_key, user_message, formatted_response, tone, chat_length, reuse_similar)
         return formatted_response
         
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
-        return "Sorry, I'm having trouble generating a response right now. Please try again."
+        return GENERATION_ERROR_RESPONSE
+
+def stream_response(user_message: str, context: str, chat_history: str = "", tone: str = None):
+    """Yield the GPT-4o-mini reply in chunks as they are generated (unformatted)"""
+    with chat_slots:
+        stream = openai_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_chat_messages(user_message, context, chat_history, tone),
+            temperature=CHAT_TEMPERATURE,
+            max_tokens=CHAT_MAX_TOKENS,
+            stop=CHAT_STOP_SEQUENCES,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 def format_response(text: str) -> str:
     """Format response with proper HTML line breaks and bold text"""
-    import re
+    # Most replies are 2-3 plain sentences; every rule below needs one of these markers
+    if '**' not in text and '•' not in text and '<b>' not in text and '<br>' not in text:
+        return text
     
     # Replace **text** with <b>text</b> for bold
-    text = re.sub(r'\*\*([^*]+)\*\*', r'<b>\1</b>', text)
+    text = BOLD_MARKDOWN_PATTERN.sub(r'<b>\1</b>', text)
     
     # If GPT already added <br> tags, we're good - just clean up extras
     if '<br>' in text:
         # Clean up excessive line breaks (more than 2 in a row)
-        text = re.sub(r'(<br>\s*){3,}', '<br><br>', text)
+        text = EXCESS_BREAKS_PATTERN.sub('<br><br>', text)
         return text
     
     # If no <br> tags, add them between bullets
@@ -416,13 +1018,26 @@ def format_response(text: str) -> str:
             text = f"{intro}<br><br>{formatted_bullets}"
     
     # Replace numbered lists with bullets
-    text = re.sub(r'(\d+)\.\s+\*\*([^*]+)\*\*', r'• <b>\2</b>', text)
-    text = re.sub(r'(\d+)\.\s+<b>([^<]+)</b>', r'• <b>\2</b>', text)
+    text = NUMBERED_BOLD_MARKDOWN_PATTERN.sub(r'• <b>\2</b>', text)
+    text = NUMBERED_BOLD_HTML_PATTERN.sub(r'• <b>\2</b>', text)
     
     return text
 
+def warm_up_services() -> None:
+    """Warm connections, then (optionally) the context cache"""
+    warm_connections()
+    if CACHE_WARM_ON_STARTUP:
+        try:
+            queries = load_hot_queries(HOT_QUERIES_FILE)
+        except Exception as e:
+            logger.warning(f"Hot queries not loaded from {HOT_QUERIES_FILE}: {str(e)}")
+            return
+        warm_context_cache(queries)
+
 # Initialize services on startup
-initialize_services()
+if initialize_services():
+    # In the background so the worker starts serving immediately
+    threading.Thread(target=warm_up_services, name="warm-up", daemon=True).start()
 
 # Routes
 @app.route('/')
@@ -430,6 +1045,184 @@ def index():
     """Main chat interface"""
     return render_template('index.html')
 
+def start_chat_turn(data: dict) -> dict:
+    """Run the rule-based part of a chat turn.
+    
+    Returns {'reply': payload, 'status': code} when the turn is answered without GPT,
+    otherwise the turn state that finish_chat_turn needs once the AI response is ready.
+    """
+    user_message = data.get('message', '').strip()
+    original_user_message = user_message  # Save original before any modifications
+    incoming_token = data.get('token', '')
+    
+    if not user_message:
+        return {'reply': {'error': 'Message cannot be empty'}, 'status': 400}
+    
+    logger.info(f"📨 User: {user_message}")
+    logger.info(f"🔍 Token received: {'Yes' if incoming_token else 'No (new session)'}")
+    
+    # Decode existing token or create new session
+    if incoming_token:
+        session_data = decode_token(incoming_token, include_history=False)
+        history = session_data['chat_history']
+        selected_tone = session_data['tone']
+        # Expired or invalid tokens decode without a session id; with Redis on they start a new session
+        # (valid tokens that still carry their history inside keep it there)
+        session_id = session_data['session_id'] or (new_session_id() if not history else None)
+        message_count = session_data['message_count']
+        pending_problem = session_data['pending_problem']
+        logger.info(f"✅ Decoded token - History length: {message_count}, Tone: {selected_tone}")
+    else:
+        history = []
+        selected_tone = None
+        session_id = new_session_id()
+        message_count = 0
+        pending_problem = None
+        logger.info("✅ New session - No token provided")
+    
+    # Check if services are initialized
+    if not qdrant_client or not openai_client:
+        logger.error("Services not initialized, attempting to reinitialize...")
+        if not initialize_services():
+            return {'reply': {'error': 'Services unavailable. Please try again later.', 'success': False}, 'status': 503}
+    
+    # Check message limit (10 messages = 5 exchanges)
+    # Nothing changes on this path, so hand back the incoming token instead of re-signing one
+    if message_count >= FREE_MESSAGE_LIMIT:
+        return {'reply': {
+            'response': f"You've reached the free message limit ({FREE_MESSAGE_LIMIT} messages). Upgrade to Premium for unlimited conversations! 🚀",
+            'limit_reached': True,
+            'quick_replies': [],
+            'token': incoming_token,
+            'success': True
+        }, 'status': 200}
+    
+    # HANDLE TONE SELECTION (user_message is already stripped)
+    if user_message in TONE_OPTIONS:
+        selected_tone = user_message
+        logger.info(f"✅ Tone '{selected_tone}' selected")
+        
+        # Get the user's problem, recorded in the token when the tone question was asked
+        if not pending_problem:
+            # Older tokens: fall back to the most recent non-greeting, non-tone message in history
+            if history is None:
+                history = load_history(session_id)
+            pending_problem = next(
+                (h['user'] for h in reversed(history) if h['user'].lower() not in PROBLEM_SKIP_MESSAGES),
+                None
+            )
+        
+        # If we found their problem, REPLACE user_message with it
+        if pending_problem:
+            user_message = pending_problem
+            logger.info(f"🔄 Responding to original problem: {user_message[:50]}...")
+    
+    # Lowercased once for the greeting check and the canned-reply keyword scans
+    msg_lower = user_message.lower()
+    
+    # Check if this is a greeting (not a real problem)
+    is_greeting = msg_lower in GREETING_WORDS
+    
+    # Check if message is meaningful (not just 1-2 random words)
+    word_count = len(user_message.split())
+    is_meaningful_query = word_count >= 3  # Any message with 3+ words is considered real
+    
+    # Before a tone is chosen, non-greetings get a fixed reply: real problems are asked for a tone,
+    # 1-2 word messages are asked to elaborate
+    if selected_tone is None and not is_greeting:
+        ai_response, quick_replies = PRE_TONE_REPLIES[is_meaningful_query]
+        
+        # No prompt is built here, so Redis-backed history isn't read; only the new entry is pushed
+        if history is None:
+            history = []
+        
+        # Add to history
+        append_history(history, {
+            'user': original_user_message,
+            'ai': ai_response,
+            'timestamp': time.time()
+        }, session_id)
+        
+        # Create new token, remembering a real problem for the tone reply
+        new_token = create_token(history, selected_tone, session_id, message_count + 1,
+                                 pending_problem=original_user_message if is_meaningful_query else None)
+        
+        return {'reply': {
+            'response': ai_response,
+            'quick_replies': list(quick_replies),
+            'token': new_token,
+            'success': True
+        }, 'status': 200}
+    
+    # Calculate chat length BEFORE adding current message (the token's count matches the history length)
+    chat_length = message_count + 1
+    
+    # Greetings and safety triggers have fixed replies, so skip embedding and Qdrant for them
+    canned_reply = canned_response(user_message, chat_length, msg_lower)
+    
+    # Start fetching Qdrant context now; it is only awaited right before generation
+    context_future = None
+    if canned_reply is None:
+        context_future = context_executor.submit(get_relevant_context, user_message)
+    
+    # Redis-backed history loads while the context lookup is in flight
+    if history is None:
+        history = load_history(session_id, HISTORY_PROMPT_EXCHANGES)
+    
+    # Build chat history string for context only when GPT will read it
+    chat_history = format_chat_history(history) if canned_reply is None else ""
+    
+    # Near-duplicate replies may only be shared while the prompt holds no GPT-written turns
+    # (the first coaching reply); later replies depend on each user's own conversation
+    reuse_similar = canned_reply is None and not has_gpt_turns(history)
+    
+    return {
+        'user_message': user_message,
+        'original_user_message': original_user_message,
+        'history': history,
+        'selected_tone': selected_tone,
+        'session_id': session_id,
+        'message_count': message_count,
+        'chat_history': chat_history,
+        'canned_reply': canned_reply,
+        'context_future': context_future,
+        'reuse_similar': reuse_similar
+    }
+
+def finish_chat_turn(turn: dict, ai_response: str) -> dict:
+    """Record the AI response in history and build the reply payload with a fresh token"""
+    history = turn['history']
+    
+    # Add to history (use ORIGINAL message if tone was selected)
+    append_history(history, {
+        'user': turn['original_user_message'],
+        'ai': ai_response,
+        'timestamp': time.time()
+    }, turn['session_id'])
+    
+    logger.info(f"✅ AI: {ai_response[:100]}...")
+    
+    # Smart quick reply flow
+    quick_replies = []
+    
+    # Never show buttons after safety warnings (the canned warnings all start with ⚠️ or say "call 911")
+    if ai_response.startswith("⚠️") or "call 911" in ai_response:
+        logger.info("⚠️ Safety warning - no buttons")
+    
+    # Create new token with updated history and tone (Redis mode only holds the recent entries, so count explicitly)
+    new_token = create_token(history, turn['selected_tone'], turn['session_id'], turn['message_count'] + 1)
+    
+    return {
+        'response': ai_response,
+        'quick_replies': quick_replies,
+        'token': new_token,
+        'success': True
+    }
+
+def sse_event(event: str, payload: dict) -> str:
+    """Frame a payload as a Server-Sent Event"""
+    return f"event: {event}\ndata: {app.json.dumps(payload)}\n\n"
+
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 def chat():
     """Handle chat messages with JWT token-based sessions"""
@@ -442,155 +1235,22 @@ def chat():
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         return response
     
+    # Clients that ask for Server-Sent Events get the streamed reply from the same URL
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        return chat_stream()
+    
     try:
-        data = request.get_json()
-        user_message = data.get('message', '').strip()
-        original_user_message = user_message  # Save original before any modifications
-        incoming_token = data.get('token', '')
-        
-        if not user_message:
-            return jsonify({'error': 'Message cannot be empty'}), 400
-        
-        logger.info(f"📨 User: {user_message}")
-        logger.info(f"🔍 Token received: {'Yes' if incoming_token else 'No (new session)'}")
-        
-        # Decode existing token or create new session
-        if incoming_token:
-            session_data = decode_token(incoming_token)
-            history = session_data['chat_history']
-            selected_tone = session_data['tone']
-            logger.info(f"✅ Decoded token - History length: {len(history)}, Tone: {selected_tone}")
-        else:
-            history = []
-            selected_tone = None
-            logger.info("✅ New session - No token provided")
-        
-        # Check if services are initialized
-        if not qdrant_client or not openai_client:
-            logger.error("Services not initialized, attempting to reinitialize...")
-            if not initialize_services():
-                return jsonify({'error': 'Services unavailable. Please try again later.', 'success': False}), 503
-        
-        # Check message limit (10 messages = 5 exchanges)
-        current_count = len(history)
-        if current_count >= 10:
-            new_token = create_token(history, selected_tone)
-            return jsonify({
-                'response': "You've reached the free message limit (10 messages). Upgrade to Premium for unlimited conversations! 🚀",
-                'limit_reached': True,
-                'quick_replies': [],
-                'token': new_token,
-                'success': True
-            })
-        
-        # Get relevant context from Qdrant using OpenAI embeddings
-        context = get_relevant_context(user_message)
-        
-        # Build chat history string for context (last 4 exchanges)
-        chat_history = "\n".join([f"User: {h['user']}\nAI: {h['ai']}" for h in history[-4:]])
-        
-        # HANDLE TONE SELECTION
-        if user_message.strip() in ["Professional", "Casual"]:
-            selected_tone = user_message.strip()
-            logger.info(f"✅ Tone '{selected_tone}' selected")
-            
-            # Get the user's problem from chat history
-            user_messages = []
-            for h in history:
-                msg = h['user']
-                # Skip greetings and tone selections
-                if msg.lower() not in ['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'professional', 'casual', 'before i help you with this, how would you like me to respond?']:
-                    user_messages.append(msg)
-            
-            # If we found their problem, REPLACE user_message with it
-            if user_messages:
-                user_message = user_messages[-1]  # Get the most recent problem statement
-                logger.info(f"🔄 Responding to original problem: {user_message[:50]}...")
-        
-        # Check if this is a greeting (not a real problem)
-        greeting_words = ['hi', 'hello', 'hey', 'hii', 'hiii', 'sup', 'yo', 'howdy']
-        is_greeting = user_message.lower().strip() in greeting_words
-        
-        # Check if message is meaningful (not just 1-2 random words)
-        word_count = len(user_message.split())
-        is_meaningful_query = word_count >= 3  # Any message with 3+ words is considered real
-        
-        # If no tone selected and this is a real problem (not greeting), ask for tone FIRST
-        if selected_tone is None and not is_greeting and is_meaningful_query:
-            ai_response = "Before I help you with this, how would you like me to respond?"
-            
-            # Add to history
-            history.append({
-                'user': original_user_message,
-                'ai': ai_response,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            
-            # Create new token with updated history
-            new_token = create_token(history, selected_tone)
-            
-            return jsonify({
-                'response': ai_response,
-                'quick_replies': ["Professional", "Casual"],
-                'token': new_token,
-                'success': True
-            })
-        
-        # If it's just 1-2 random words (not meaningful), ask them to elaborate
-        if selected_tone is None and not is_greeting and not is_meaningful_query:
-            ai_response = "Could you tell me a bit more about what's going on?"
-            
-            # Add to history
-            history.append({
-                'user': original_user_message,
-                'ai': ai_response,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            
-            # Create new token
-            new_token = create_token(history, selected_tone)
-            
-            return jsonify({
-                'response': ai_response,
-                'quick_replies': [],
-                'token': new_token,
-                'success': True
-            })
-        
-        # Calculate chat length BEFORE adding current message
-        current_chat_length = len(history) + 1
-        
-        # Generate response using GPT-4o-mini with Qdrant context
-        ai_response = generate_response(user_message, context, chat_history, selected_tone, current_chat_length)
-        
-        # Add to history (use ORIGINAL message if tone was selected)
-        history.append({
-            'user': original_user_message,
-            'ai': ai_response,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
-        logger.info(f"✅ AI: {ai_response[:100]}...")
-        
-        # Smart quick reply flow
-        is_safety_warning = ai_response.startswith("⚠️") or "call 911" in ai_response.lower()
-        
-        quick_replies = []
+        turn = start_chat_turn(request.get_json())
+        if 'reply' in turn:
+            return jsonify(turn['reply']), turn['status']
         
-        # Never show buttons after safety warnings
-        if is_safety_warning:
-            quick_replies = []
-            logger.info("⚠️ Safety warning - no buttons")
+        ai_response = turn['canned_reply']
+        if ai_response is None:
+            # Generate response using GPT-4o-mini with Qdrant context
+            context = turn['context_future'].result()
+            ai_response = generate_response(turn['user_message'], context, turn['chat_history'], turn['selected_tone'], turn['message_count'] + 1, turn['reuse_similar'])
         
-        # Create new token with updated history and tone
-        new_token = create_token(history, selected_tone)
-        
-        response_data = jsonify({
-            'response': ai_response,
-            'quick_replies': quick_replies,
-            'token': new_token,
-            'success': True
-        })
+        response_data = jsonify(finish_chat_turn(turn, ai_response))
         
         # CORS headers
         response_data.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
@@ -605,6 +1265,77 @@ def chat():
             'success': False
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+def chat_stream():
+    """Handle chat messages, streaming the AI reply as Server-Sent Events"""
+    # Handle preflight request
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        return response
+    
+    try:
+        turn = start_chat_turn(request.get_json())
+    except Exception as e:
+        logger.error(f"❌ Error in chat stream endpoint: {str(e)}")
+        return jsonify({
+            'error': 'An error occurred while processing your message.',
+            'success': False
+        }), 500
+    
+    if 'reply' in turn and turn['status'] != 200:
+        return jsonify(turn['reply']), turn['status']
+    
+    def generate():
+        # Rule-based replies arrive as a single "done" event
+        if 'reply' in turn:
+            yield sse_event('done', turn['reply'])
+            return
+        
+        ai_response = turn['canned_reply']
+        if ai_response is None:
+            chunks = []
+            try:
+                context = turn['context_future'].result()
+                chat_length = turn['message_count'] + 1
+                cache_key = response_cache_key(turn['user_message'], context, turn['chat_history'], turn['selected_tone'])
+                ai_response = get_cached_reply(cache_key, turn['user_message'], turn['selected_tone'], chat_length, turn['reuse_similar'])
+                if ai_response is None:
+                    for delta in stream_response(turn['user_message'], context, turn['chat_history'], turn['selected_tone']):
+                        chunks.append(delta)
+                        yield sse_event('delta', {'delta': delta})
+                    ai_response = format_response("".join(chunks).strip())
+                    cache_reply(cache_key, turn['user_message'], ai_response, turn['selected_tone'], chat_length, turn['reuse_similar'])
+            except Exception as e:
+                logger.error(f"Error streaming response: {str(e)}")
+                ai_response = GENERATION_ERROR_RESPONSE
+        
+        # The final event carries the formatted response, quick replies and the new token
+        try:
+            payload = finish_chat_turn(turn, ai_response)
+        except Exception as e:
+            # Same body /api/chat returns with its 500; the status line is already sent
+            logger.error(f"❌ Error in chat stream endpoint: {str(e)}")
+            payload = {
+                'error': 'An error occurred while processing your message.',
+                'success': False
+            }
+        yield sse_event('done', payload)
+    
+    response_data = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response_data.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream, which would hold back the first token
+    response_data.headers['X-Accel-Buffering'] = 'no'
+    
+    # CORS headers
+    response_data.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+    response_data.headers['Access-Control-Allow-Credentials'] = 'true'
+    
+    return response_data
+
 @app.route('/api/history', methods=['GET', 'OPTIONS'])
 def get_history():
     """Get chat history from JWT token"""
@@ -626,12 +1357,19 @@ def get_history():
         logger.info("🔍 No token provided - returning empty history")
         return jsonify({'history': []})
     
-    # Decode token
-    session_data = decode_token(token)
+    # Decode token (Redis-backed history is loaded here)
+    try:
+        session_data = decode_token(token)
+    except Exception as e:
+        logger.error(f"❌ Failed to load chat history: {str(e)}")
+        return jsonify({'history': [], 'error': 'Chat history is temporarily unavailable'}), 503
     history = session_data['chat_history']
     
     logger.info(f"🔍 History request - Token valid: {session_data.get('valid', False)}, History length: {len(history)}")
     
+    # History stores epoch seconds; only this endpoint needs them as ISO strings
+    history = [{**entry, 'timestamp': format_timestamp(entry['timestamp'])} for entry in history]
+    
     response_data = jsonify({'history': history})
     
     # CORS headers
@@ -653,7 +1391,7 @@ def clear_history():
         return response
     
     # Create new empty token
-    new_token = create_token([], None)
+    new_token = create_token([], None, new_session_id())
     
     response_data = jsonify({
         'success': True,
@@ -672,9 +1410,9 @@ def health():
         'status': 'healthy',
         'qdrant_connected': qdrant_client is not None,
         'openai_ready': openai_client is not None,
-        'model': 'gpt-4o-mini',
-        'embeddings': 'text-embedding-3-small',
-        'timestamp': datetime.now().isoformat()
+        'model': CHAT_MODEL,
+        'embeddings': EMBEDDING_MODEL,
+        'timestamp': now_iso()
     })
 
 @app.route('/api/session-check')
@@ -695,8 +1433,12 @@ def session_check():
             }
         })
     
-    # Decode token
-    session_data = decode_token(token)
+    # Decode token (Redis-backed history is loaded here)
+    try:
+        session_data = decode_token(token)
+    except Exception as e:
+        logger.error(f"❌ Failed to load chat history: {str(e)}")
+        session_data = {**decode_token(token, include_history=False), 'chat_history': [], 'error': f'History unavailable: {str(e)}'}
     
     return jsonify({
         'has_token': True,
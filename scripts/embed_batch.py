@@ -0,0 +1,143 @@
+"""Embed workplace scenarios with OpenAI's Batch API and upsert them into Qdrant.
+
+Offline companion to app.py: bulk (re)embedding goes through the Batch API at half the
+per-token price instead of one embeddings.create call per scenario. The live chat path
+is unchanged.
+
+Input is a JSONL file, one scenario per line, e.g.
+    {"id": 1, "text": "My manager keeps ...", "scenario": "Credit stealing"}
+"id" becomes the Qdrant point id and every other field is stored as the payload.
+
+Usage:
+    python scripts/embed_batch.py scenarios.jsonl
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from openai import OpenAI
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+load_dotenv(override=False)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Must match the collection and embedding settings in app.py
+COLLECTION_NAME = "bridgetext_scenarios"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 768
+
+BATCH_ENDPOINT = "/v1/embeddings"
+BATCH_MAX_REQUESTS = 50000  # Batch API limit per input file
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+UPSERT_BATCH_SIZE = 256
+
+
+def load_scenarios(path: str) -> list:
+    """Read scenarios from a JSONL file, skipping blank lines"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_batch_file(scenarios: list) -> bytes:
+    """Build the Batch API input: one embeddings request per scenario, keyed by its index"""
+    lines = []
+    for index, scenario in enumerate(scenarios):
+        lines.append(json.dumps({
+            "custom_id": str(index),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": EMBEDDING_MODEL,
+                "input": scenario["text"],
+                "dimensions": EMBEDDING_DIMENSIONS
+            }
+        }))
+    return "\n".join(lines).encode('utf-8')
+
+
+def run_batch(openai_client: OpenAI, scenarios: list, poll_seconds: int) -> dict:
+    """Submit one batch job and wait for it; returns {scenario index: embedding}"""
+    batch_file = openai_client.files.create(
+        file=("embeddings.jsonl", io.BytesIO(build_batch_file(scenarios))),
+        purpose="batch"
+    )
+    batch = openai_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h"
+    )
+    logger.info(f"📤 Submitted batch {batch.id} with {len(scenarios)} scenarios")
+
+    while batch.status not in BATCH_FINAL_STATUSES:
+        time.sleep(poll_seconds)
+        batch = openai_client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        logger.info(f"⏳ Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total} done)" if counts else f"⏳ Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    embeddings = {}
+    for line in openai_client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.warning(f"  ✗ Scenario {result['custom_id']} failed: {result.get('error') or response.get('body')}")
+            continue
+        embeddings[int(result["custom_id"])] = response["body"]["data"][0]["embedding"]
+    return embeddings
+
+
+def upsert_embeddings(qdrant_client: QdrantClient, scenarios: list, embeddings: dict, offset: int):
+    """Upsert embedded scenarios into Qdrant in fixed-size chunks"""
+    points = [
+        PointStruct(
+            id=scenarios[index]["id"],
+            vector=vector,
+            payload={key: value for key, value in scenarios[index].items() if key != "id"}
+        )
+        for index, vector in sorted(embeddings.items())
+    ]
+    for start in range(0, len(points), UPSERT_BATCH_SIZE):
+        qdrant_client.upsert(
+            collection_name=COLLECTION_NAME,
+            points=points[start:start + UPSERT_BATCH_SIZE],
+            wait=True
+        )
+    logger.info(f"✅ Upserted {len(points)} scenarios ({offset + 1}-{offset + len(scenarios)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed scenarios with the OpenAI Batch API and upsert them into Qdrant")
+    parser.add_argument("input", help="JSONL file with one {'id', 'text', ...} scenario per line")
+    parser.add_argument("--poll-seconds", type=int, default=30, help="Seconds between batch status checks")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.input)
+    missing = [index for index, scenario in enumerate(scenarios) if "id" not in scenario or not scenario.get("text")]
+    if missing:
+        raise SystemExit(f"❌ Lines missing 'id' or 'text': {[index + 1 for index in missing[:10]]}")
+
+    openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    qdrant_client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+
+    for offset in range(0, len(scenarios), BATCH_MAX_REQUESTS):
+        chunk = scenarios[offset:offset + BATCH_MAX_REQUESTS]
+        embeddings = run_batch(openai_client, chunk, args.poll_seconds)
+        upsert_embeddings(qdrant_client, chunk, embeddings, offset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Enable int8 scalar quantization on the scenarios collection in Qdrant.
+
+One-time admin step: Qdrant keeps an int8 copy of every vector in RAM (a quarter of the
+float32 size) and searches that, while app.py already asks for rescoring with 2x
+oversampling so results keep full-precision ordering. Safe to re-run.
+
+Usage:
+    python scripts/quantize_collection.py
+"""
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import ScalarQuantization, ScalarQuantizationConfig, ScalarType
+
+load_dotenv(override=False)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Must match the collection in app.py
+COLLECTION_NAME = "bridgetext_scenarios"
+
+QUANTILE = 0.99  # Clip the 1% most extreme values so outliers don't waste the int8 range
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enable int8 scalar quantization on the scenarios collection")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection to update")
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+
+    current = qdrant_client.get_collection(args.collection).config.quantization_config
+    if current is not None:
+        logger.info(f"ℹ️ Current quantization: {current}")
+
+    qdrant_client.update_collection(
+        collection_name=args.collection,
+        quantization_config=ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=QUANTILE,
+                always_ram=True
+            )
+        )
+    )
+    logger.info(f"✅ Enabled int8 scalar quantization (always_ram) on '{args.collection}'; Qdrant builds it in the background")
+
+
+if __name__ == '__main__':
+    main()
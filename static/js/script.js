@@ -66,8 +66,8 @@ async function sendMessage() {
     loadingOverlay.style.display = 'flex';
     
     try {
-        // Send to backend
-        const response = await fetch('/api/chat', {
+        // Send to backend and stream the reply as it is generated
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -75,18 +75,41 @@ async function sendMessage() {
             body: JSON.stringify({ message })
         });
         
-        const data = await response.json();
-        
-        console.log('📦 Backend response:', data);
-        console.log('🎯 Quick replies received:', data.quick_replies);
-        
-        if (data.success) {
-            // Add AI response
-            addMessage(data.response, 'ai', data.quick_replies);
-        } else {
+        if (!response.ok || !response.body) {
             addMessage('Sorry, something went wrong. Please try again.', 'ai');
+            return;
         }
         
+        let streamingMessage = null;
+        let streamedText = '';
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'delta') {
+                // Show raw text while streaming; the final event carries the formatted HTML
+                if (!streamingMessage) {
+                    loadingOverlay.style.display = 'none';
+                    streamingMessage = addMessage('', 'ai');
+                    streamingMessage.querySelector('.message-content').classList.add('streaming');
+                }
+                streamedText += data.delta;
+                streamingMessage.querySelector('.message-content').textContent = streamedText;
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            } else if (event === 'done') {
+                console.log('📦 Backend response:', data);
+                console.log('🎯 Quick replies received:', data.quick_replies);
+                
+                if (streamingMessage) {
+                    streamingMessage.remove();
+                }
+                
+                if (data.success) {
+                    addMessage(data.response, 'ai', data.quick_replies);
+                } else {
+                    addMessage('Sorry, something went wrong. Please try again.', 'ai');
+                }
+            }
+        });
+        
     } catch (error) {
         console.error('Error:', error);
         addMessage('Sorry, I couldn\'t connect to the server. Please try again.', 'ai');
@@ -154,6 +177,44 @@ function addMessage(text, type, quickReplies = null) {
     
     // Scroll to bottom
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    
+    return messageDiv;
+}
+
+// Read a Server-Sent Events response body, calling onEvent(event, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
 }
 
 // Clear chat